@@ -1,6 +1,7 @@
 # init_db.py
 import duckdb
 import os
+import random
 import time
 import portalocker
 from contextlib import contextmanager
@@ -39,53 +40,205 @@ def _read_schema():
     with open(SCHEMA_FILE, "r", encoding="utf-8") as f:
         return f.read()
 
-def init_db():
+def _column_type(conn, table, column):
+    row = conn.execute(
+        "SELECT data_type FROM information_schema.columns WHERE table_name = ? AND column_name = ?",
+        [table, column],
+    ).fetchone()
+    return row[0] if row else None
+
+def _drop_indexes(conn, table):
     """
-    Safe DB initialization with cross-process locking and retry.
-    This will only let one process run the DDL at once.
+    DuckDB refuses to ALTER a column while indexes depend on the table.
+    Drop them here; schema.sql recreates them right after the migration.
     """
-    # Ensure directory exists
-    db_dir = os.path.dirname(DB_PATH)
-    if db_dir:
-        os.makedirs(db_dir, exist_ok=True)
+    for (name,) in conn.execute(
+        "SELECT index_name FROM duckdb_indexes() WHERE table_name = ?", [table]
+    ).fetchall():
+        conn.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+def _migrate(conn):
+    """Upgrade databases created by older schema.sql versions. Fresh DBs skip every step."""
+    # skills: JSON-encoded TEXT -> native VARCHAR[]
+    if _column_type(conn, "candidates", "skills") == "VARCHAR":
+        _drop_indexes(conn, "candidates")
+        conn.execute(
+            """
+            ALTER TABLE candidates ALTER COLUMN skills TYPE VARCHAR[] USING
+                CASE
+                    WHEN json_valid(skills) AND json_type(skills) = 'ARRAY'
+                        THEN from_json(skills, '["VARCHAR"]')
+                    -- plain "a, b" strings or malformed JSON arrays
+                    WHEN skills IS NOT NULL
+                        THEN list_filter(
+                            list_transform(
+                                string_split(trim(skills, '[] '), ','),
+                                s -> trim(trim(s), '"')
+                            ),
+                            s -> s <> ''
+                        )
+                END
+            """
+        )
+
+    # embeddings: candidates.embedding -> candidate_embeddings (schema.sql adds
+    # and backfills the quantized columns afterwards)
+    if _column_type(conn, "candidates", "embedding") is not None:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS candidate_embeddings (candidate_id INTEGER PRIMARY KEY, embedding DOUBLE[])"
+        )
+        conn.execute(
+            """
+            INSERT OR IGNORE INTO candidate_embeddings (candidate_id, embedding)
+            SELECT id, embedding FROM candidates WHERE embedding IS NOT NULL
+            """
+        )
+        _drop_indexes(conn, "candidates")
+        for column in ("embedding_vec", "embedding_scale", "embedding_q", "embedding"):
+            if _column_type(conn, "candidates", column) is not None:
+                conn.execute(f"ALTER TABLE candidates DROP COLUMN {column}")
+
+def _load_extension(conn, name):
+    """Load a DuckDB extension (installing it if needed). False when unavailable, e.g. offline."""
+    try:
+        conn.execute(f"LOAD {name}")
+    except duckdb.Error:
+        try:
+            conn.execute(f"INSTALL {name}")
+            conn.execute(f"LOAD {name}")
+        except duckdb.Error as e:
+            print(f"{name} extension unavailable:", e)
+            return False
+    return True
+
+def load_vss(conn):
+    """Load vss for HNSW search; without it semantic search stays brute-force."""
+    if not _load_extension(conn, "vss"):
+        return False
+    # HNSW indexes on a file-backed DB are only allowed with this flag
+    conn.execute("SET hnsw_enable_experimental_persistence = true")
+    return True
+
+def load_fts(conn):
+    """Load fts for BM25 keyword search; without it search is vector-only."""
+    return _load_extension(conn, "fts")
+
+def build_fts_index(conn):
+    """
+    (Re)build the BM25 index over candidates.raw_text (skills and summaries are
+    part of the resume text). DuckDB's fts index is a snapshot: it does not
+    follow inserts, so the server rebuilds it after uploads. The pragma drops
+    and recreates the fts_main_candidates schema; one transaction keeps
+    concurrent searches on the old index until the new one commits.
+    """
+    conn.begin()
+    try:
+        conn.execute("PRAGMA create_fts_index('candidates', 'id', 'raw_text', overwrite = 1)")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
 
+def fts_ready(conn):
+    """True when fts loads and the candidates BM25 index exists."""
+    return load_fts(conn) and conn.execute(
+        "SELECT count(*) FROM duckdb_schemas() WHERE schema_name = 'fts_main_candidates'"
+    ).fetchone()[0] > 0
+
+def vss_ready(conn, dim):
+    """True when the HNSW-indexed embedding_vec column matches the embedding model's dim."""
+    return (
+        bool(dim)
+        and load_vss(conn)
+        and _column_type(conn, "candidate_embeddings", "embedding_vec") == f"FLOAT[{dim}]"
+    )
+
+def _setup_vss(conn, dim):
+    """
+    HNSW needs a fixed-size FLOAT[dim] column, so keep a copy of embeddings of
+    the current model's dim in embedding_vec and index that.
+    """
+    if not dim or not load_vss(conn):
+        return
+    vec_type = _column_type(conn, "candidate_embeddings", "embedding_vec")
+    if vec_type is not None and vec_type != f"FLOAT[{dim}]":
+        # embedding model changed: rebuild the column for the new dim
+        conn.execute("DROP INDEX IF EXISTS idx_candidate_embeddings_hnsw")
+        conn.execute("ALTER TABLE candidate_embeddings DROP COLUMN embedding_vec")
+    else:
+        # indexes built before the switch to inner product used l2sq
+        row = conn.execute(
+            "SELECT sql FROM duckdb_indexes() WHERE index_name = 'idx_candidate_embeddings_hnsw'"
+        ).fetchone()
+        if row and "'ip'" not in row[0]:
+            conn.execute("DROP INDEX idx_candidate_embeddings_hnsw")
+    conn.execute(f"ALTER TABLE candidate_embeddings ADD COLUMN IF NOT EXISTS embedding_vec FLOAT[{dim}]")
+    conn.execute(
+        f"""
+        UPDATE candidate_embeddings SET embedding_vec = CAST(embedding AS FLOAT[{dim}])
+        WHERE embedding_vec IS NULL AND len(embedding) = {dim}
+        """
+    )
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_candidate_embeddings_hnsw
+        ON candidate_embeddings USING HNSW (embedding_vec)
+        WITH (metric = 'ip', M = 32, ef_construction = 128)
+        """
+    )
+
+def _apply_schema(embed_dim=None):
+    """
+    Run schema.sql, retrying transient DuckDB errors (e.g. the file still being
+    held by another process) with jittered exponential backoff capped at 1s.
+    """
     start = time.time()
     backoff = INITIAL_BACKOFF
 
     while True:
         try:
-            # Acquire the file lock to ensure a single initializer
-            with file_lock(LOCK_FILE):
-                # Once we hold the lock, open the DB and run schema
-                conn = duckdb.connect(DB_PATH)
-                try:
-                    schema_sql = _read_schema()
-                    # Make sure schema.sql is idempotent (use CREATE TABLE IF NOT EXISTS)
-                    conn.execute(schema_sql)
-                    # Optional: run a simple test query
-                    conn.execute("PRAGMA show_progress=false")  # harmless
-                finally:
-                    conn.close()
-                print("Initialized DuckDB at:", DB_PATH)
-                return  # success
-        except portalocker.exceptions.LockException:
-            # couldn't get the lock, fall through to retry
-            pass
+            conn = duckdb.connect(DB_PATH)
+            try:
+                _migrate(conn)
+                schema_sql = _read_schema()
+                # Make sure schema.sql is idempotent (use CREATE TABLE IF NOT EXISTS)
+                conn.execute(schema_sql)
+                _setup_vss(conn, embed_dim)
+                if load_fts(conn):
+                    build_fts_index(conn)
+                # Optional: run a simple test query
+                conn.execute("SELECT 1").fetchone()  # harmless
+            finally:
+                conn.close()
+            return
         except duckdb.Error as e:
-            # Common error when DB is temporarily locked; we'll retry
-            # If it's an unexpected error, raise after timeout
-            last_err = e
-
-        # timeout handling
-        elapsed = time.time() - start
-        if elapsed >= MAX_WAIT_SECONDS:
-            # Give a helpful error after timeout
-            raise RuntimeError(
-                f"Timed out trying to initialize DuckDB at {DB_PATH} after {MAX_WAIT_SECONDS}s. "
-                f"Last error: {locals().get('last_err')}"
-            )
-        time.sleep(backoff)
+            elapsed = time.time() - start
+            if elapsed >= MAX_WAIT_SECONDS:
+                # Give a helpful error after timeout
+                raise RuntimeError(
+                    f"Timed out trying to initialize DuckDB at {DB_PATH} after {MAX_WAIT_SECONDS}s. "
+                    f"Last error: {e}"
+                ) from e
+        # jitter so concurrently starting workers don't retry in lockstep
+        time.sleep(backoff * random.uniform(0.5, 1.5))
         backoff = min(backoff * 2, 1.0)  # exponential backoff (cap 1s)
 
+def init_db(embed_dim=None):
+    """
+    Safe DB initialization with cross-process locking.
+    embed_dim (the embedding model's output size) enables the HNSW index.
+    This will only let one process run the DDL at once; the others block in
+    the kernel until the lock holder releases it.
+    """
+    # Ensure directory exists
+    db_dir = os.path.dirname(DB_PATH)
+    if db_dir:
+        os.makedirs(db_dir, exist_ok=True)
+
+    # Blocking LOCK_EX: no polling needed to wait for another initializer
+    with file_lock(LOCK_FILE):
+        _apply_schema(embed_dim)
+    print("Initialized DuckDB at:", DB_PATH)
+
 if __name__ == "__main__":
     init_db()
@@ -6,11 +6,45 @@ CREATE TABLE IF NOT EXISTS candidates (
     email TEXT,
     phone TEXT,
     experience_years TEXT,
-    skills TEXT,
+    skills VARCHAR[],
     education_summary TEXT,
     professional_summary TEXT,
     raw_text TEXT,
+    file_sha256 TEXT, -- SHA-256 of the uploaded file, used to skip re-uploads
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- databases created before file_sha256 existed
+ALTER TABLE candidates ADD COLUMN IF NOT EXISTS file_sha256 TEXT;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_candidates_file_sha256 ON candidates(file_sha256);
+
+-- embeddings, one row per candidate. Kept out of candidates so vector scans
+-- read only narrow vector columns, never raw_text and the other wide fields.
+-- candidate_id is candidates.id; there is no FOREIGN KEY because DuckDB
+-- would then refuse every later ALTER TABLE on candidates.
+CREATE TABLE IF NOT EXISTS candidate_embeddings (
+    candidate_id INTEGER PRIMARY KEY,
     embedding DOUBLE[],
+    embedding_q TINYINT[], -- int8-quantized embedding, embedding ~= embedding_q * embedding_scale
+    embedding_scale FLOAT
+);
+
+-- tables migrated from candidates.embedding (init_db) start without these
+ALTER TABLE candidate_embeddings ADD COLUMN IF NOT EXISTS embedding_q TINYINT[];
+ALTER TABLE candidate_embeddings ADD COLUMN IF NOT EXISTS embedding_scale FLOAT;
+
+-- backfill int8 embeddings for rows inserted before quantization
+UPDATE candidate_embeddings
+SET embedding_scale = coalesce(nullif(list_max(list_transform(embedding, x -> abs(x))), 0), 127) / 127
+WHERE embedding_scale IS NULL AND embedding IS NOT NULL;
+UPDATE candidate_embeddings
+SET embedding_q = list_transform(embedding, x -> round(x / embedding_scale)::TINYINT)
+WHERE embedding_q IS NULL AND embedding IS NOT NULL;
+
+-- embedding cache keyed by SHA-256 of the embedding model name + OCR'd text
+CREATE TABLE IF NOT EXISTS embed_cache (
+    sha256 TEXT PRIMARY KEY,
+    embedding DOUBLE[] NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -31,3 +65,11 @@ CREATE TABLE IF NOT EXISTS chat_messages (
     content TEXT NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
+
+-- get_chat filters on chat_id; DuckDB only takes the ART index for selective
+-- equality lookups (it falls back to a scan for large hits), so this pays off
+-- once chat_messages holds many chats. Index upkeep on insert is small next
+-- to one message row. No index on candidates.created_at: ORDER BY ... LIMIT
+-- already runs as a TOP_N with a dynamic zone-map filter, which an ART index
+-- would not improve.
+CREATE INDEX IF NOT EXISTS idx_chat_messages_chat_id ON chat_messages(chat_id);
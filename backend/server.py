@@ -3,33 +3,61 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import asyncio
-import json
+import hashlib
 import logging
+import multiprocessing
 import os
+import queue
 import re
-import shutil
+import threading
 import uuid
 
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
-import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager, contextmanager
 from typing import Any, Dict, List, Optional, Tuple
 
 import duckdb
+import httpx
+import numpy as np
+import orjson
 import requests
+
 from fastapi import FastAPI, File, Form, HTTPException, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse
+from db.init_db import build_fts_index, fts_ready, init_db, vss_ready
+from pydantic import BaseModel, Field
 from workers import embed_worker, extract_worker, ocr_worker, search_worker
 
 BASE_DIR = os.path.dirname(__file__)
 DB_PATH = os.path.join(BASE_DIR, "db", "candidates.duckdb")
 TMP_DIR = os.path.join(BASE_DIR, "tmp")
 PARALLAX_HOST = os.environ.get("PARALLAX_HOST", "http://localhost:3001")
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+# Open the DB read-only (search/list only, no uploads). Several read-only
+# processes can share the file, but DuckDB's file lock refuses them while a
+# read-write process has it open, and vice versa: run either one writer or
+# only read-only workers (e.g. serving a finished DB), never both at once.
+DB_READ_ONLY = os.environ.get("DB_READ_ONLY", "").lower() in ("1", "true", "yes")
+COPY_BUFFER_SIZE = 4 * 1024 * 1024  # uploads are multi-MB PDFs; fewer, larger syscalls
+# OCR is CPU-bound and holds the GIL, so it runs in separate processes.
+# Each worker runs torch with ocr_worker.TORCH_THREADS (2) intra-op threads,
+# so half the cores' worth of workers keeps the machine from oversubscribing.
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+UPLOAD_CONCURRENCY = int(os.environ.get("UPLOAD_CONCURRENCY", os.cpu_count() or 4))
+# Seconds an upload waits before rebuilding the BM25 index, so bursts share one rebuild
+FTS_REBUILD_DELAY = float(os.environ.get("FTS_REBUILD_DELAY", "5"))
 
 os.makedirs(TMP_DIR, exist_ok=True)
 
+# Precompiled patterns used on every uploaded resume
+_EMAIL_RE = re.compile(r"[A-Za-z0-9._%+\-]+@[A-Za-z0-9.\-]+\.[A-Za-z]{2,}")
+_PHONE_RE = re.compile(r"\+?\d[\d\-\s().]{6,}\d")
+_PHONE_CLEAN_RE = re.compile(r"[^\d+]")
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
@@ -39,8 +67,34 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    open_db()
+    start_ocr_pool()
+    # One shared client for Parallax: extractions reuse its keep-alive
+    # connections instead of opening a new one per request
+    app.state.llm = httpx.AsyncClient(
+        base_url=PARALLAX_HOST,
+        timeout=60,
+        limits=httpx.Limits(max_connections=32),
+    )
+    try:
+        yield
+    finally:
+        # a pending BM25 rebuild is dropped; init_db rebuilds the index on the next start
+        if _fts_task is not None:
+            _fts_task.cancel()
+        await app.state.llm.aclose()
+        stop_ocr_pool()
+        close_db()
+
+
 # --- FastAPI app ---
-app = FastAPI(title="Resume-AI Backend")
+app = FastAPI(
+    title="Resume-AI Backend",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
+)
 # Allow Vite frontend
 app.add_middleware(
     CORSMiddleware,
@@ -60,8 +114,8 @@ class Candidate(BaseModel):
     name: Optional[str]
     email: Optional[str]
     phone: Optional[str]
-    experience_years: Optional[float]
-    skills: Optional[str]
+    experience_years: Optional[str]
+    skills: Optional[List[str]]
     education: Optional[str]
     summary: Optional[str]
     raw_text: Optional[str]
@@ -85,7 +139,7 @@ class ChatMessage(BaseModel):
 # Endpoint: semantic search
 class SearchIn(BaseModel):
     query: str
-    top_k: Optional[int] = 10
+    top_k: int = Field(10, ge=1, le=100)  # /search/vector only
 
 
 class ChatDetail(Chat):
@@ -100,149 +154,402 @@ class AddMessagesRequest(BaseModel):
     messages: List[dict]
 
 
-# Helper: connect
+# Shared DuckDB handle, opened once at startup. Requests borrow cursors from a
+# small pool instead of reconnecting (and reloading the catalog) every time.
+_DB: Optional[duckdb.DuckDBPyConnection] = None
+_DB_POOL: "queue.Queue[duckdb.DuckDBPyConnection]" = queue.Queue()
+# Cursor queries/inserts run concurrently; only runtime DDL is serialized
+_DDL_LOCK = threading.Lock()
+# Embedding dim of the HNSW-indexed embedding_vec column; None = no vss, brute-force search
+_VSS_DIM: Optional[int] = None
+# fts loaded and the BM25 index built: /search blends keyword and vector scores
+_FTS_ENABLED = False
+
+
+def open_db():
+    global _DB, _VSS_DIM, _FTS_ENABLED
+    if not DB_READ_ONLY:
+        # apply schema.sql (and its migrations) before taking the long-lived handle
+        init_db(embed_dim=embed_worker.EMBED_DIM)
+    _DB = duckdb.connect(DB_PATH, read_only=DB_READ_ONLY)
+    if vss_ready(_DB, embed_worker.EMBED_DIM):
+        _VSS_DIM = embed_worker.EMBED_DIM
+    _FTS_ENABLED = fts_ready(_DB)
+    for _ in range(DB_POOL_SIZE):
+        cur = _DB.cursor()
+        if _VSS_DIM:
+            cur.execute("SET hnsw_ef_search = 64")
+        _DB_POOL.put(cur)
+    logger.info(
+        "Opened DuckDB at %s (pool size %d, read_only=%s, hnsw=%s, fts=%s)",
+        DB_PATH,
+        DB_POOL_SIZE,
+        DB_READ_ONLY,
+        bool(_VSS_DIM),
+        _FTS_ENABLED,
+    )
+
+
+def close_db():
+    global _DB
+    # wait out a BM25 rebuild already running in a worker thread
+    with _DDL_LOCK:
+        while not _DB_POOL.empty():
+            _DB_POOL.get_nowait().close()
+        if _DB is not None:
+            _DB.close()
+            _DB = None
+
+
+# Persistent OCR worker processes; each keeps its doctr model loaded
+_OCR_POOL: Optional[ProcessPoolExecutor] = None
+
+
+def start_ocr_pool():
+    global _OCR_POOL
+    if DB_READ_ONLY:
+        return  # read-only workers never accept uploads
+    # spawn, not fork: the parent already has torch/tokenizer threads running
+    _OCR_POOL = ProcessPoolExecutor(
+        max_workers=OCR_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=ocr_worker.init_worker,
+    )
+
+
+def stop_ocr_pool():
+    global _OCR_POOL
+    if _OCR_POOL is not None:
+        _OCR_POOL.shutdown(cancel_futures=True)
+        _OCR_POOL = None
+
+
+def _replace_broken_ocr_pool(pool: ProcessPoolExecutor):
+    # concurrent uploads all see the same broken pool; only the first replaces it
+    if _OCR_POOL is pool:
+        logging.warning("OCR worker died; restarting the OCR pool")
+        stop_ocr_pool()
+        start_ocr_pool()
+
+
+async def _run_ocr(file_path: str) -> str:
+    """
+    OCR file_path in the process pool. A worker that dies (OOM, a native
+    crash) breaks the pool and fails every file in flight. The pool is
+    replaced so later uploads work, but those files are not resubmitted:
+    any of them may be the one that killed it.
+    """
+    loop = asyncio.get_running_loop()
+    pool = _OCR_POOL
+    try:
+        future = loop.run_in_executor(pool, ocr_worker.extract_text, file_path)
+    except BrokenProcessPool:
+        # rejected by a pool that broke before this file ran: safe to run on a fresh one
+        _replace_broken_ocr_pool(pool)
+        pool = _OCR_POOL
+        future = loop.run_in_executor(pool, ocr_worker.extract_text, file_path)
+    try:
+        return await future
+    except BrokenProcessPool:
+        _replace_broken_ocr_pool(pool)
+        raise RuntimeError(
+            "OCR worker crashed while this file was being processed (out of memory?)"
+        ) from None
+
+
+@contextmanager
+def _borrow_cursor():
+    """Borrow a cursor on the shared connection; it goes back to the pool on exit."""
+    cur = _DB_POOL.get()
+    try:
+        yield cur
+    finally:
+        _DB_POOL.put(cur)
+
+
+def _require_writable():
+    if DB_READ_ONLY:
+        raise HTTPException(
+            status_code=503,
+            detail="Database is opened read-only on this worker; writes are disabled",
+        )
+
+
+# Helper: connect (read-only endpoints)
+def get_ro_conn():
+    return _borrow_cursor()
+
+
+# Helper: connect (endpoints that write)
 def get_conn():
-    return duckdb.connect(DB_PATH)
+    _require_writable()
+    return _borrow_cursor()
 
 
-# Helper: safe insert
-def insert_candidate(conn, candidate_obj: dict, embedding: List[float]):
+# Helper: connect (runtime DDL such as index rebuilds), one at a time
+@contextmanager
+def get_ddl_conn():
+    _require_writable()
+    with _DDL_LOCK, _borrow_cursor() as cur:
+        yield cur
+
+
+# Helper: extracted field -> TEXT. The batch INSERT binds each column as one
+# list, which DuckDB gives a single element type, so a list/dict or number in
+# one resume must not meet a string in another.
+def _text_field(value: Any) -> Optional[str]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (list, dict)):
+        return orjson.dumps(value).decode()
+    return str(value)
+
+
+# Helper: candidate dict (+ the OCR text, kept out of the dict) -> row tuple for the candidates INSERT
+def _candidate_row(
+    candidate_obj: dict, raw_text: Optional[str], file_sha256: Optional[str]
+) -> tuple:
     logging.info("Inserting candidate: %s", candidate_obj.get("Full Name", "N/A"))
 
     logging.info("Data Inserting candidate: %s", candidate_obj)
 
-    # Normalize storage: skills as JSON string
-    skills_field = candidate_obj.get("Skills") or None
+    # Normalize storage: skills as a native VARCHAR[] list
+    skills_field = candidate_obj.get("Skills")
     if isinstance(skills_field, (list, tuple)):
-        skills_val = json.dumps(skills_field)
+        skills_val = list(skills_field)
     else:
-        skills_val = (
-            json.dumps([s.strip() for s in skills_field.split(",")])
-            if skills_field
-            else json.dumps([])
-        )
+        skills_val = [s.strip() for s in (skills_field or "").split(",") if s.strip()]
+
+    return (
+        _text_field(candidate_obj.get("Full Name")),
+        _text_field(candidate_obj.get("Email")),
+        _text_field(candidate_obj.get("Phone")),
+        _text_field(candidate_obj.get("Total Experience")),
+        skills_val,
+        _text_field(candidate_obj.get("Education Summary")),
+        _text_field(candidate_obj.get("Professional Summary")),
+        raw_text or None,
+        file_sha256,
+    )
 
-    conn.execute(
-        """
-        INSERT INTO candidates
-        (name, email, phone, experience_years, skills, education_summary, professional_summary, raw_text, embedding)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        [
-            candidate_obj.get("Full Name") or None,
-            candidate_obj.get("Email") or None,
-            candidate_obj.get("Phone") or None,
-            candidate_obj.get("Total Experience") or None,
-            skills_val,
-            candidate_obj.get("Education Summary") or None,
-            candidate_obj.get("Professional Summary") or None,
-            candidate_obj.get("raw_text") or None,
-            embedding,
-        ],
+
+# Helper: embedding -> (embedding, embedding_q, embedding_scale) for candidate_embeddings
+# (vectors are bound as JSON text, see embed_worker.vector_param)
+def _embedding_row(embedding: np.ndarray) -> tuple:
+    embedding_q, embedding_scale = embed_worker.quantize_embedding(embedding)
+    return (
+        embed_worker.vector_param(embedding),
+        embed_worker.vector_param(embedding_q),
+        embedding_scale,
     )
-    # DuckDB autocommit by default for single execute
 
 
-# --- Helper functions (included here so you can paste as a single block) ---
-def try_extract_json_from_raw(parsed: Dict[str, Any]) -> Dict[str, Any]:
+# Helper: safe insert of a whole upload batch as one statement per table / one transaction.
+# Rows go in column-wise (one list parameter per column, unnested side by side),
+# so DuckDB parses and plans each INSERT once per batch instead of once per row.
+# A file already stored under the same file_sha256 is skipped, not an error.
+# Returns the new id per row, None for skipped rows.
+def insert_candidates(
+    conn, candidates: List[Tuple[dict, str, np.ndarray, Optional[str]]]
+):
+    rows = [_candidate_row(obj, text, sha) for obj, text, _, sha in candidates]
+    conn.begin()
+    try:
+        # ids are drawn up front so embedding rows can reference them;
+        # RETURNING reports which candidates were actually inserted
+        ids = [
+            r[0]
+            for r in conn.execute(
+                "SELECT nextval('seq_candidates_id') FROM range(?)", [len(rows)]
+            ).fetchall()
+        ]
+        columns = [ids] + [list(col) for col in zip(*rows)]
+        inserted = {
+            r[0]
+            for r in conn.execute(
+                """
+                INSERT OR IGNORE INTO candidates
+                (id, name, email, phone, experience_years, skills, education_summary, professional_summary, raw_text, file_sha256)
+                SELECT
+                    unnest($1), unnest($2), unnest($3), unnest($4), unnest($5),
+                    unnest($6), unnest($7), unnest($8), unnest($9), unnest($10)
+                RETURNING id
+                """,
+                columns,
+            ).fetchall()
+        }
+
+        emb_rows = [
+            (cid, *_embedding_row(emb))
+            for cid, (_, _, emb, _) in zip(ids, candidates)
+            if cid in inserted and len(emb)
+        ]
+        if emb_rows:
+            conn.execute(
+                """
+                INSERT INTO candidate_embeddings
+                (candidate_id, embedding, embedding_q, embedding_scale)
+                SELECT
+                    unnest($1),
+                    CAST(unnest($2::VARCHAR[]) AS DOUBLE[]),
+                    CAST(unnest($3::VARCHAR[]) AS TINYINT[]),
+                    unnest($4)
+                """,
+                [list(col) for col in zip(*emb_rows)],
+            )
+        if _VSS_DIM:
+            # copy new embeddings into the fixed-size column the HNSW index covers
+            conn.execute(
+                f"""
+                UPDATE candidate_embeddings SET embedding_vec = CAST(embedding AS FLOAT[{_VSS_DIM}])
+                WHERE embedding_vec IS NULL AND len(embedding) = {_VSS_DIM}
+                """
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return [cid if cid in inserted else None for cid in ids]
+
+
+def _store_candidates(
+    candidates: List[Tuple[dict, str, np.ndarray, Optional[str]]]
+) -> List[Tuple[Optional[int], bool]]:
     """
-    Attempt to salvage structured JSON from parsed['raw'] (OpenAI-style response).
-    Returns dict if successful, else empty dict.
+    Insert an upload batch; returns (candidate_id, inserted) per row. A row
+    skipped because a concurrent upload stored the same file first gets that
+    row's id.
     """
-    raw = parsed.get("raw") if isinstance(parsed, dict) else None
-    if not raw:
-        return {}
+    with get_conn() as conn:
+        ids = insert_candidates(conn, candidates)
+        skipped = [sha for cid, (*_, sha) in zip(ids, candidates) if cid is None]
+        existing = dict(
+            conn.execute(
+                "SELECT file_sha256, id FROM candidates WHERE file_sha256 IN (SELECT unnest(?))",
+                [skipped],
+            ).fetchall()
+        ) if skipped else {}
+    return [
+        (cid, True) if cid is not None else (existing.get(sha), False)
+        for cid, (*_, sha) in zip(ids, candidates)
+    ]
+
+
+# BM25 index rebuilds run after uploads, off the request path. Uploads landing
+# while one is pending or running only mark the index dirty, so a burst of
+# uploads costs one rebuild. Until it runs, new rows are still found by the
+# vector part of /search.
+_fts_dirty = False
+_fts_task: Optional[asyncio.Task] = None
 
+
+def _rebuild_fts():
+    with get_ddl_conn() as conn:
+        build_fts_index(conn)
+
+
+async def _fts_rebuilder():
+    global _fts_dirty, _fts_task
     try:
-        choices = raw.get("choices") or []
-        if not choices:
-            return {}
-
-        content = None
-        for choice in choices:
-            msg = choice.get("message") or {}
-            c = msg.get("content")
-            if c:
-                content = c
-                break
-        if not content:
-            return {}
-
-        content = content.strip()
-
-        # Remove code fences if present
-        if content.startswith("```"):
-            content = re.sub(r"^```(?:json)?\s*", "", content)
-            content = re.sub(r"\s*```$", "", content)
-
-        # Try direct json.loads
-        try:
-            data = json.loads(content)
-            if isinstance(data, dict):
-                return data
-        except Exception:
-            # fallback: extract substring from first '{' to last '}' and try load
-            m = re.search(r"(\{.*\})", content, re.DOTALL)
-            if m:
-                candidate = m.group(1)
-                # common fixes: remove trailing commas before closing braces/brackets
-                candidate = re.sub(r",(\s*[}\]])", r"\1", candidate)
-                try:
-                    data = json.loads(candidate)
-                    if isinstance(data, dict):
-                        return data
-                except Exception as e:
-                    logging.warning("Could not json.loads candidate, error: %s", e)
+        while _fts_dirty:
+            await asyncio.sleep(FTS_REBUILD_DELAY)
+            _fts_dirty = False
+            try:
+                await asyncio.to_thread(_rebuild_fts)
+            except Exception as e:
+                logging.error(f"Error rebuilding the fts index: {str(e)}", exc_info=True)
+    finally:
+        _fts_task = None
 
-    except Exception as e:
-        logging.exception("Failed to extract JSON from raw: %s", e)
-
-    return {}
-
-
-KEY_MAPPING = {
-    "full name": "Full Name",
-    "fullname": "Full Name",
-    "Full Name": "Full Name",
-    "name": "Full Name",
-    "email": "Email",
-    "Email": "Email",
-    "phone": "Phone",
-    "Phone": "Phone",
-    "phone number": "Phone",
-    "skills": "Skills",
-    "Skills (as a list)": "Skills",
-    "Skills": "Skills",
-    "total experience": "Total Experience",
-    "Total Experience in working": "Total Experience",
-    "Total Experience": "Total Experience",
-    "education summary": "Education Summary",
-    "Education summary": "Education Summary",
-    "Education Summary": "Education Summary",
-    "professional summary": "Professional Summary",
-    "Professional Summary": "Professional Summary",
-    "Professional summary": "Professional Summary",
-}
 
-# small mapping of common variant keys -> canonical keys
+def _schedule_fts_rebuild():
+    global _fts_dirty, _fts_task
+    _fts_dirty = True
+    if _fts_task is None:
+        _fts_task = asyncio.create_task(_fts_rebuilder())
+
+
+def _find_candidate_by_hash(file_sha256: str) -> Optional[int]:
+    with get_ro_conn() as conn:
+        row = conn.execute(
+            "SELECT id FROM candidates WHERE file_sha256 = ?", [file_sha256]
+        ).fetchone()
+    return row[0] if row else None
+
+
+def _embed_cached(raw_texts: List[str]) -> List[np.ndarray]:
+    """
+    Embed a batch of texts, reusing stored embeddings for texts seen before.
+    Cache misses go through a single batched forward pass. Keys include the
+    model name: macOS and Linux embed with different models into the same DB.
+    """
+    prefix = f"{embed_worker.MODEL_NAME}\0"
+    hashes = [
+        hashlib.sha256((prefix + t).encode("utf-8")).hexdigest() for t in raw_texts
+    ]
+    with get_ro_conn() as conn:
+        cached = {
+            h: np.asarray(emb, dtype=np.float32)
+            for h, emb in conn.execute(
+                "SELECT sha256, embedding FROM embed_cache WHERE sha256 IN (SELECT unnest(?))",
+                [hashes],
+            ).fetchall()
+        }
+
+    # identical texts in one upload are embedded once
+    misses = {h: t for h, t in zip(hashes, raw_texts) if h not in cached}
+    if misses:
+        fresh = dict(zip(misses, embed_worker.embed_texts(list(misses.values()))))
+        new_rows = [
+            (h, embed_worker.vector_param(emb)) for h, emb in fresh.items() if len(emb)
+        ]
+        if new_rows:
+            with get_conn() as conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO embed_cache (sha256, embedding) VALUES (?, CAST(? AS DOUBLE[]))",
+                    new_rows,
+                )
+        cached.update(fresh)
+
+    return [cached.get(h, embed_worker.EMPTY_EMBEDDING) for h in hashes]
+
+
+# common variant keys -> canonical keys
 _KEY_VARIANTS = {
-    "full name": ["Full Name", "fullname", "name", "candidate_name", "candidateName"],
-    "email": ["Email", "email", "e-mail", "contact_email"],
-    "phone": ["Phone", "phone", "phone number", "contact_number", "mobile"],
-    "skills": ["Skills", "skills", "Skills (as a list)", "skillset"],
-    "total_experience": [
+    "Full Name": [
+        "Full Name",
+        "full name",
+        "fullname",
+        "full_name",
+        "name",
+        "candidate_name",
+        "candidateName",
+    ],
+    "Email": ["Email", "email", "e-mail", "contact_email"],
+    "Phone": [
+        "Phone",
+        "phone",
+        "phone number",
+        "contact_number",
+        "mobile",
+    ],
+    "Skills": ["Skills", "skills", "Skills (as a list)", "skillset"],
+    "Total Experience": [
         "Total Experience",
         "Total Experience in working",
+        "total_experience",
         "Experience",
         "TotalExperience",
     ],
-    "education": [
+    "Education Summary": [
         "Education Summary",
         "Education summary",
         "Education",
         "education_summary",
     ],
-    "professional": [
+    "Professional Summary": [
         "Professional Summary",
         "Professional summary",
         "Summary",
@@ -250,19 +557,17 @@ _KEY_VARIANTS = {
     ],
 }
 
+# flat {variant: canonical} table, built once so each key is a single lookup
+_CANONICAL_LOOKUP: Dict[str, str] = {}
+for _canonical, _variants in _KEY_VARIANTS.items():
+    for _variant in _variants:
+        _CANONICAL_LOOKUP[_variant] = _canonical
+        _CANONICAL_LOOKUP[_variant.lower()] = _canonical
 
-def normalize_keys(d: Dict[str, Any]) -> Dict[str, Any]:
-    out = {}
-    for k, v in d.items():
-        if not isinstance(k, str):
-            continue
-        key_l = k.strip()
-        mapped = KEY_MAPPING.get(key_l) or KEY_MAPPING.get(key_l.lower())
-        if mapped:
-            out[mapped] = v
-        else:
-            out[k] = v
-    return out
+
+def _canonical_key(k: str) -> Optional[str]:
+    k = k.strip()
+    return _CANONICAL_LOOKUP.get(k) or _CANONICAL_LOOKUP.get(k.lower())
 
 
 # Endpoint: health
@@ -271,27 +576,59 @@ def health():
     return {"status": "ok"}
 
 
-def _find_variant(parsed: Dict[str, Any], variants: list):
-    """Return the first non-empty value for any key variant, else None."""
-    for k in variants:
-        if k in parsed:
-            val = parsed[k]
-            if val is None:
-                continue
-            # treat empty strings or empty lists as missing
-            if isinstance(val, str) and len(val.strip()) == 0:
-                continue
-            if isinstance(val, (list, dict)) and len(val) == 0:
-                continue
-            return val
-    return None
+def _is_empty(val: Any) -> bool:
+    # treat None, empty strings or empty lists as missing
+    if val is None:
+        return True
+    if isinstance(val, str) and len(val.strip()) == 0:
+        return True
+    if isinstance(val, (list, dict)) and len(val) == 0:
+        return True
+    return False
+
+
+def _flatten_skills(val: Any) -> List[str]:
+    """Allow comma-separated string or list-of-strings; always return a flat list."""
+    if isinstance(val, list):
+        skills = []
+        for it in val:
+            if isinstance(it, str):
+                # split comma-separated entries inside list items
+                skills += [s.strip() for s in it.split(",") if s.strip()]
+        return skills
+    if isinstance(val, str):
+        return [s.strip() for s in val.split(",") if s.strip()]
+    if val is None:
+        return []
+    # fallback: try to coerce to str
+    return [str(val)]
+
+
+def canonicalize(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Map an extracted dict onto the canonical fields in a single walk.
+
+    Unknown keys are dropped, the first non-empty value for each field wins,
+    and Skills is flattened to a list of strings on the way through.
+    """
+    out: Dict[str, Any] = dict.fromkeys(_KEY_VARIANTS)
+    for k, val in raw.items():
+        if not isinstance(k, str):
+            continue
+        field = _canonical_key(k)
+        if field is None or not _is_empty(out[field]) or _is_empty(val):
+            continue
+        out[field] = _flatten_skills(val) if field == "Skills" else val
+    if out["Skills"] is None:
+        out["Skills"] = []
+    return out
 
 
 def _extract_email_from_text(text: str):
     if not text:
         return None
     # looser search for emails anywhere in text
-    m = re.search(r"[A-Za-z0-9._%+\-]+@[A-Za-z0-9.\-]+\.[A-Za-z]{2,}", text)
+    m = _EMAIL_RE.search(text)
     return m.group(0) if m else None
 
 
@@ -300,26 +637,36 @@ def _extract_phone_from_text(text: str):
         return None
     # Accept common international formats, spaces, dashes, parentheses.
     # We look for sequences of digits with optional + at start, min length 7
-    m = re.search(r"(\+?\d[\d\-\s().]{6,}\d)", text)
+    m = _PHONE_RE.search(text)
     if not m:
         return None
-    # Clean up extracted phone
-    phone = re.sub(r"[^\d+]", " ", m.group(1)).strip()
-    return phone
+    # Clean up extracted phone; short matches are cheaper to scan than to regex
+    phone = m.group(0)
+    if len(phone) < 50:
+        phone = "".join(c if c.isdigit() or c == "+" else " " for c in phone)
+    else:
+        phone = _PHONE_CLEAN_RE.sub(" ", phone)
+    return phone.strip()
 
 
 def _extract_name_from_text(text: str):
     if not text:
         return None
     # Heuristic: take the first non-empty line that contains 2 words and letters (likely name)
-    lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
-    for ln in lines[:10]:  # only check the top portion
+    checked = 0
+    for ln in text.splitlines():
+        ln = ln.strip()
+        if not ln:
+            continue
+        checked += 1
+        if checked > 10:  # only check the top portion
+            break
         # ignore lines that look like emails or phones or contain too many chars
-        if re.search(r"@", ln) or re.search(r"\d", ln):
+        if "@" in ln or any(c.isdigit() for c in ln):
             continue
         # if line has 2-4 space-separated words and words are alphabetic-ish, choose it
         parts = ln.split()
-        if 1 < len(parts) <= 4 and all(re.search(r"[A-Za-z]", p) for p in parts):
+        if 1 < len(parts) <= 4 and all(any(c.isalpha() for c in p) for p in parts):
             # sanity length check
             joined = " ".join(parts)
             if 3 <= len(joined) <= 60:
@@ -327,6 +674,18 @@ def _extract_name_from_text(text: str):
     return None
 
 
+def _is_valid_email(v) -> bool:
+    if not v:
+        return False
+    return bool(_EMAIL_RE.search(str(v)))
+
+
+def _is_valid_phone(v) -> bool:
+    if not v:
+        return False
+    return bool(_PHONE_RE.search(str(v)))
+
+
 def validate_parsed_data(parsed: dict, raw_text: str) -> Tuple[bool, str]:
     """
     Validate parsed resume data and return (is_valid, error_message).
@@ -339,20 +698,8 @@ def validate_parsed_data(parsed: dict, raw_text: str) -> Tuple[bool, str]:
     if not raw_text or len(raw_text.strip()) < 50:
         return False, "Extracted text too short (< 50 chars). Resume may be unreadable."
 
-    # 1. canonicalize: try to find values for each logical field using variants
-    canonical: Dict[str, Any] = {}
-
-    canonical["Full Name"] = _find_variant(parsed, _KEY_VARIANTS["full name"])
-    canonical["Email"] = _find_variant(parsed, _KEY_VARIANTS["email"])
-    canonical["Phone"] = _find_variant(parsed, _KEY_VARIANTS["phone"])
-    canonical["Skills"] = _find_variant(parsed, _KEY_VARIANTS["skills"])
-    canonical["Total Experience"] = _find_variant(
-        parsed, _KEY_VARIANTS["total_experience"]
-    )
-    canonical["Education Summary"] = _find_variant(parsed, _KEY_VARIANTS["education"])
-    canonical["Professional Summary"] = _find_variant(
-        parsed, _KEY_VARIANTS["professional"]
-    )
+    # 1. canonicalize: map key variants and flatten skills in one pass
+    canonical = canonicalize(parsed)
 
     # 2. salvage from raw_text if missing (email/phone/name)
     if not canonical["Email"]:
@@ -362,24 +709,6 @@ def validate_parsed_data(parsed: dict, raw_text: str) -> Tuple[bool, str]:
     if not canonical["Full Name"]:
         canonical["Full Name"] = _extract_name_from_text(raw_text)
 
-    # 3. Normalize skill field: allow comma-separated string or list-of-strings
-    skills_val = canonical.get("Skills")
-    normalized_skills = []
-    if isinstance(skills_val, list):
-        for it in skills_val:
-            if isinstance(it, str):
-                # split comma-separated entries inside list items
-                normalized_skills += [s.strip() for s in it.split(",") if s.strip()]
-    elif isinstance(skills_val, str):
-        normalized_skills = [s.strip() for s in skills_val.split(",") if s.strip()]
-    elif skills_val is None:
-        normalized_skills = []
-    else:
-        # fallback: try to coerce to str
-        normalized_skills = [str(skills_val)]
-
-    canonical["Skills"] = normalized_skills
-
     # 4. scoring setup
     field_weights = {
         "Full Name": 2,
@@ -394,19 +723,6 @@ def validate_parsed_data(parsed: dict, raw_text: str) -> Tuple[bool, str]:
     score = 0
     present_fields = set()
 
-    # helpers for email/phone detection
-    def is_valid_email(v):
-        if not v:
-            return False
-        return bool(
-            re.search(r"[A-Za-z0-9._%+\-]+@[A-Za-z0-9.\-]+\.[A-Za-z]{2,}", str(v))
-        )
-
-    def is_valid_phone(v):
-        if not v:
-            return False
-        return bool(re.search(r"\+?\d[\d\-\s().]{6,}\d", str(v)))
-
     for field, weight in field_weights.items():
         value = canonical.get(field)
         valid = False
@@ -414,10 +730,10 @@ def validate_parsed_data(parsed: dict, raw_text: str) -> Tuple[bool, str]:
         if value is None:
             valid = False
         elif field == "Email":
-            if is_valid_email(value):
+            if _is_valid_email(value):
                 valid = True
         elif field == "Phone":
-            if is_valid_phone(value):
+            if _is_valid_phone(value):
                 valid = True
         elif field == "Skills":
             if isinstance(value, list) and len(value) > 0:
@@ -462,73 +778,150 @@ def validate_parsed_data(parsed: dict, raw_text: str) -> Tuple[bool, str]:
     return True, ""
 
 
-def process_and_insert_resume(file: UploadFile) -> Dict[str, Any]:
+async def process_resume(raw_text: str, filename: str) -> Dict[str, Any]:
     """
-    Process resume: Save -> OCR -> Extract -> Normalize -> Validate -> Embed -> DB.
+    Process an OCR'd resume: Extract -> Normalize -> Validate.
+
+    upload_resume embeds every parsed resume in one batch and then inserts
+    the whole batch into the DB once every file has been processed.
     """
-    logging.info(f"Processing file: {file.filename}")
+    logging.info(f"Processing file: {filename}")
 
     try:
-        with tempfile.NamedTemporaryFile(
-            delete=True, suffix=f"_{file.filename}"
-        ) as tmp_file:
-            shutil.copyfileobj(file.file, tmp_file)
-            tmp_file.flush()
+        # 2. Extract Fields
+        raw_parsed = await extract_worker.extract_fields_async(raw_text, app.state.llm)
+
+        logger.info("raw_parsed_data 🦕: %s", raw_parsed)
+
+        if raw_parsed.get("status") != "ok":
+            error_msg = f"Extraction failed: {raw_parsed.get('error', 'unknown error')}"
+            logging.error(f"{error_msg} for {filename}")
+            return {
+                "status": "error",
+                "filename": filename,
+                "detail": error_msg,
+            }
 
-            # 1. OCR
-            raw_text = ocr_worker.extract_text(tmp_file.name)
+        # 3. Normalize: canonical keys + flattened skills in one walk
+        parsed = canonicalize(raw_parsed["data"])
 
-            # 2. Extract Fields
-            raw_parsed = extract_worker.extract_fields(raw_text)
+        has_name = bool(parsed["Full Name"])
+        has_contact = bool(parsed["Email"] or parsed["Phone"])
 
-            logger.info("raw_parsed_data 🦕: %s", raw_parsed)
+        logger.info("has_name: -> %s", has_name)
+        logger.info("has_contact: -> %s", has_contact)
 
-            has_name = bool(raw_parsed["data"].get("Full Name"))
-            has_contact = bool(
-                raw_parsed["data"].get("Email") or raw_parsed["data"].get("Phone")
-            )
+        if not has_name or not has_contact:
+            error_msg = "Extraction failed: Missing Full Name or Contact Information or Backend error"
+            logging.error(f"{error_msg} for {filename}")
+            return {
+                "status": "error",
+                "filename": filename,
+                "detail": error_msg,
+            }
+
+        # 4. Validate
+        is_valid, error_msg = validate_parsed_data(parsed, raw_text)
+        if not is_valid:
+            logging.error(f"Validation failed for {filename}: {error_msg}")
+            return {
+                "status": "error",
+                "filename": filename,
+                "detail": error_msg,
+            }
+
+        logging.info(f"Successfully processed {filename}")
+        # raw_text travels next to parsed (not inside it) to the insert, and
+        # is dropped before the upload response
+        return {
+            "status": "ok",
+            "parsed": parsed,
+            "raw_text": raw_text,
+            "filename": filename,
+        }
+
+    except Exception as e:
+        logging.error(f"Error processing {filename}: {str(e)}", exc_info=True)
+        return {"status": "error", "filename": filename, "detail": str(e)}
 
-            logger.info("has_name: ->", has_name)
-            logger.info("has_contact: ->", has_contact)
 
-            if not has_name or not has_contact:
-                error_msg = "Extraction failed: Missing Full Name or Contact Information or Backend error"
-                logging.error(f"{error_msg} for {file.filename}")
+def _spool_path(filename: Optional[str]) -> str:
+    # keep the original name last so OCR can still tell PDFs from images
+    name = os.path.basename(filename or "upload")
+    return os.path.join(TMP_DIR, f"{uuid.uuid4().hex}_{name}")
+
+
+def _copy_upload(src, file_path: str) -> str:
+    # one pass over the upload: every chunk is hashed and written as it is read
+    digest = hashlib.sha256()
+    src.seek(0)
+    with open(file_path, "wb") as dst:
+        while chunk := src.read(COPY_BUFFER_SIZE):
+            digest.update(chunk)
+            dst.write(chunk)
+    return digest.hexdigest()
+
+
+async def _spool_upload(file: UploadFile) -> Tuple[str, str]:
+    """
+    Write an upload to TMP_DIR without blocking the event loop.
+    Returns (path, sha256 of the contents), hashed while the bytes are copied.
+    """
+    file_path = _spool_path(file.filename)
+    file_sha256 = await asyncio.to_thread(_copy_upload, file.file, file_path)
+    return file_path, file_sha256
+
+
+# Caps how many uploaded files are OCR'd/embedded at once
+_UPLOAD_SEM = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
+
+async def _process_resume_bounded(
+    file: UploadFile, seen: Dict[str, str]
+) -> Dict[str, Any]:
+    async with _UPLOAD_SEM:
+        file_path = None
+        try:
+            file_path, file_sha256 = await _spool_upload(file)
+
+            # Same bytes earlier in this request: processed once, by that file.
+            # No await between the check and the insert, so tasks can't race.
+            if file_sha256 in seen:
                 return {
-                    "status": "error",
+                    "status": "ok",
                     "filename": file.filename,
-                    "detail": error_msg,
+                    "duplicate": True,
+                    "duplicate_of": seen[file_sha256],
+                    "file_sha256": file_sha256,
                 }
+            seen[file_sha256] = file.filename
 
-            # 4. Validate
-            is_valid, error_msg = validate_parsed_data(raw_parsed["data"], raw_text)
-            if not is_valid:
-                logging.error(f"Validation failed for {file.filename}: {error_msg}")
+            # Same bytes already stored: skip OCR/extract/embed entirely
+            candidate_id = await asyncio.to_thread(_find_candidate_by_hash, file_sha256)
+            if candidate_id is not None:
+                logging.info(f"{file.filename} already stored as candidate {candidate_id}")
                 return {
-                    "status": "error",
+                    "status": "ok",
                     "filename": file.filename,
-                    "detail": error_msg,
+                    "duplicate": True,
+                    "candidate_id": candidate_id,
                 }
 
-            # 5. Embed
-            embedding = embed_worker.embed_text(raw_text)
+            # 1. OCR in the process pool. Extraction only waits on the LLM, so
+            # it is awaited here; embedding happens per batch afterwards.
+            raw_text = await _run_ocr(file_path)
 
-            # 6. Insert into DB
-            with get_conn() as conn:
-                insert_candidate(conn, raw_parsed["data"], embedding)
-
-            logging.info(f"Successfully processed {file.filename}")
-            return {
-                "status": "ok",
-                "parsed": raw_parsed["data"],
-                "filename": file.filename,
-            }
-
-    except Exception as e:
-        logging.error(f"Error processing {file.filename}: {str(e)}", exc_info=True)
-        return {"status": "error", "filename": file.filename, "detail": str(e)}
-    finally:
-        file.file.close()
+            result = await process_resume(raw_text, file.filename)
+            if result["status"] == "ok":
+                result["file_sha256"] = file_sha256
+            return result
+        except Exception as e:
+            logging.error(f"Error processing {file.filename}: {str(e)}", exc_info=True)
+            return {"status": "error", "filename": file.filename, "detail": str(e)}
+        finally:
+            await file.close()
+            if file_path and os.path.exists(file_path):
+                os.unlink(file_path)
 
 
 # Endpoint: upload resume (PDF)
@@ -537,110 +930,181 @@ async def upload_resume(files: List[UploadFile] = File(...)):
     """
     Accepts multiple resume files, processes them concurrently, and stores them.
     """
-    tasks = [asyncio.to_thread(process_and_insert_resume, file) for file in files]
+    _require_writable()
+    seen: Dict[str, str] = {}  # file_sha256 -> first filename with those bytes
+    tasks = [_process_resume_bounded(file, seen) for file in files]
     results = await asyncio.gather(*tasks)
-    return JSONResponse(content={"results": results})
+
+    # 5. Embed every new resume in one batched forward pass
+    # (duplicates carry no parsed data: they are already stored)
+    ok = [r for r in results if r["status"] == "ok" and "parsed" in r]
+    if ok:
+        try:
+            embeddings = await asyncio.to_thread(
+                _embed_cached, [r["raw_text"] for r in ok]
+            )
+        except Exception as e:
+            logging.error(f"Error embedding upload batch: {str(e)}", exc_info=True)
+            embeddings = [embed_worker.EMPTY_EMBEDDING for _ in ok]
+        for r, emb in zip(ok, embeddings):
+            r["embedding"] = emb
+
+    # 6. Insert every successfully processed resume into the DB in one batch
+    stored_ids: Dict[str, int] = {}  # file_sha256 -> candidate id
+    if ok:
+        batch = [
+            (r["parsed"], r.pop("raw_text"), r.pop("embedding"), r.pop("file_sha256"))
+            for r in ok
+        ]
+        try:
+            stored = await asyncio.to_thread(_store_candidates, batch)
+        except Exception as e:
+            logging.error(f"Error inserting upload batch: {str(e)}", exc_info=True)
+            for r in ok:
+                r["status"] = "error"
+                r["detail"] = str(e)
+        else:
+            for r, (*_, sha), (candidate_id, inserted) in zip(ok, batch, stored):
+                r["candidate_id"] = candidate_id
+                if not inserted:
+                    # a concurrent upload stored the same file first
+                    r["duplicate"] = True
+                if candidate_id is not None:
+                    stored_ids[sha] = candidate_id
+            if _FTS_ENABLED:
+                _schedule_fts_rebuild()
+
+    # 7. Copies of a file earlier in this request share its outcome
+    for r in results:
+        if "duplicate_of" not in r:
+            continue
+        candidate_id = stored_ids.get(r.pop("file_sha256"))
+        if candidate_id is None:
+            r["status"] = "error"
+            r["detail"] = f"Same file as {r['duplicate_of']}, which was not stored"
+        else:
+            r["candidate_id"] = candidate_id
+
+    return ORJSONResponse(content={"results": results})
+
+
+# One struct per row, shaped like the Candidate model; DuckDB converts each
+# struct straight to a dict, so no per-row Python dict building is needed.
+_CANDIDATE_STRUCT = """
+    {
+        'id': id,
+        'name': name,
+        'email': email,
+        'phone': phone,
+        'experience_years': experience_years,
+        'skills': skills,
+        'education': education_summary,
+        'summary': professional_summary,
+        'raw_text': raw_text,
+        'created_at': CAST(created_at AS VARCHAR)
+    }
+"""
 
 
 # Endpoint: list candidates (basic)
 @app.get("/candidates", response_model=List[Candidate])
 def list_candidates(limit: int = 50, offset: int = 0):
     logger.info("candidates endpoint accessed")
-    conn = get_conn()
-    rows = conn.execute(
-        """
-        SELECT id, name, email, phone, experience_years, skills, education_summary, professional_summary, raw_text, created_at
-        FROM candidates
-        ORDER BY created_at DESC
-        LIMIT ? OFFSET ?
-    """,
-        [limit, offset],
-    ).fetchall()
-    conn.close()
-
-    results = []
-    for r in rows:
-        results.append(
-            {
-                "id": r[0],
-                "name": r[1],
-                "email": r[2],
-                "phone": r[3],
-                "experience_years": r[4],
-                "skills": r[5],
-                "education_summary": r[6],
-                "professional_summary": r[7],
-                "raw_text": r[8],
-                "created_at": r[9],
-            }
-        )
-    return results
+    with get_ro_conn() as conn:
+        rows = conn.execute(
+            f"""
+            SELECT {_CANDIDATE_STRUCT}
+            FROM candidates
+            ORDER BY created_at DESC
+            LIMIT ? OFFSET ?
+        """,
+            [limit, offset],
+        ).fetchall()
+    return [r[0] for r in rows]
 
 
 # Endpoint: get candidate by id
 @app.get("/candidate/{candidate_id}", response_model=Candidate)
 def get_candidate(candidate_id: int):
-    conn = get_conn()
-    row = conn.execute(
-        """
-        SELECT id, name, email, phone, experience_years, skills, education, summary, raw_text, created_at
-        FROM candidates
-        WHERE id = ?
-    """,
-        [candidate_id],
-    ).fetchone()
-    conn.close()
+    with get_ro_conn() as conn:
+        row = conn.execute(
+            f"""
+            SELECT {_CANDIDATE_STRUCT}
+            FROM candidates
+            WHERE id = ?
+        """,
+            [candidate_id],
+        ).fetchone()
     if not row:
         raise HTTPException(status_code=404, detail="Candidate not found")
-    return {
-        "id": row[0],
-        "name": row[1],
-        "email": row[2],
-        "phone": row[3],
-        "experience_years": row[4],
-        "skills": row[5],
-        "education": row[6],
-        "summary": row[7],
-        "raw_text": row[8],
-        "created_at": row[9],
-    }
+    return row[0]
 
 
 # Endpoint: searching with embeddings
 @app.post("/search")
 def semantic_search(body: SearchIn):
     try:
-        result_text = search_worker.search_candidates(body.query)
-        return JSONResponse({"result": result_text})
+        with get_ro_conn() as conn:
+            result_text = search_worker.search_candidates(
+                conn, body.query, ann_dim=_VSS_DIM, hybrid=_FTS_ENABLED
+            )
+        return ORJSONResponse({"result": result_text})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Endpoint: ranked top_k candidates straight from the vector index, as a plain
+# JSON list (no {"result": ...} wrapper, no LLM anywhere on the path)
+@app.post("/search/vector")
+def vector_search(body: SearchIn):
+    try:
+        with get_ro_conn() as conn:
+            rows = search_worker.search_candidates(
+                conn, body.query, ann_dim=_VSS_DIM, top_k=body.top_k
+            )
+        return ORJSONResponse(rows)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def insert_messages(conn, chat_id: int, messages: List[dict]):
+    if not messages:
+        return
+    conn.executemany(
+        "INSERT INTO chat_messages (chat_id, role, content) VALUES (?, ?, ?)",
+        [(chat_id, message["role"], message["content"]) for message in messages],
+    )
+
+
 @app.get("/api/chats", response_model=List[Chat])
 def get_chats():
-    conn = get_conn()
-    rows = conn.execute(
-        "SELECT id, title, created_at FROM chats ORDER BY created_at DESC"
-    ).fetchall()
-    conn.close()
+    with get_ro_conn() as conn:
+        rows = conn.execute(
+            "SELECT id, title, created_at FROM chats ORDER BY created_at DESC"
+        ).fetchall()
     return [{"id": row[0], "title": row[1], "created_at": str(row[2])} for row in rows]
 
 
 @app.get("/api/chats/{chat_id}", response_model=ChatDetail)
-def get_chat(chat_id: int):
-    conn = get_conn()
-    chat_row = conn.execute(
-        "SELECT id, title, created_at FROM chats WHERE id = ?", [chat_id]
-    ).fetchone()
+async def get_chat(chat_id: int):
+    def _load():
+        with get_ro_conn() as conn:
+            chat_row = conn.execute(
+                "SELECT id, title, created_at FROM chats WHERE id = ?", [chat_id]
+            ).fetchone()
+            if not chat_row:
+                return None, []
+
+            messages_rows = conn.execute(
+                "SELECT id, chat_id, role, content, created_at FROM chat_messages WHERE chat_id = ? ORDER BY created_at ASC",
+                [chat_id],
+            ).fetchall()
+            return chat_row, messages_rows
+
+    chat_row, messages_rows = await asyncio.to_thread(_load)
     if not chat_row:
         raise HTTPException(status_code=404, detail="Chat not found")
 
-    messages_rows = conn.execute(
-        "SELECT id, chat_id, role, content, created_at FROM chat_messages WHERE chat_id = ? ORDER BY created_at ASC",
-        [chat_id],
-    ).fetchall()
-    conn.close()
-
     messages = [
         {
             "id": row[0],
@@ -661,58 +1125,52 @@ def get_chat(chat_id: int):
 
 
 @app.post("/api/chats", response_model=Chat)
-def create_chat(request: CreateChatRequest):
-    conn = get_conn()
-    try:
-        # Create a title for the chat from the first user message
-        first_user_message = next(
-            (msg for msg in request.messages if msg["role"] == "user"), None
-        )
-        title = first_user_message["content"][:50] if first_user_message else "New Chat"
+async def create_chat(request: CreateChatRequest):
+    # Create a title for the chat from the first user message
+    first_user_message = next(
+        (msg for msg in request.messages if msg["role"] == "user"), None
+    )
+    title = first_user_message["content"][:50] if first_user_message else "New Chat"
 
-        # Insert into chats table
-        chat_id = conn.execute(
-            "INSERT INTO chats (title) VALUES (?) RETURNING id", [title]
-        ).fetchone()[0]
+    def _create():
+        with get_conn() as conn:
+            # Insert into chats table
+            chat_id = conn.execute(
+                "INSERT INTO chats (title) VALUES (?) RETURNING id", [title]
+            ).fetchone()[0]
 
-        # Insert messages into chat_messages table
-        for message in request.messages:
-            conn.execute(
-                "INSERT INTO chat_messages (chat_id, role, content) VALUES (?, ?, ?)",
-                [chat_id, message["role"], message["content"]],
-            )
+            # Insert messages into chat_messages table
+            insert_messages(conn, chat_id, request.messages)
 
-        chat_row = conn.execute(
-            "SELECT id, title, created_at FROM chats WHERE id = ?", [chat_id]
-        ).fetchone()
+            return conn.execute(
+                "SELECT id, title, created_at FROM chats WHERE id = ?", [chat_id]
+            ).fetchone()
 
-        return {
-            "id": chat_row[0],
-            "title": chat_row[1],
-            "created_at": str(chat_row[2]),
-        }
-    finally:
-        conn.close()
+    chat_row = await asyncio.to_thread(_create)
 
+    return {
+        "id": chat_row[0],
+        "title": chat_row[1],
+        "created_at": str(chat_row[2]),
+    }
 
-@app.post("/api/chats/{chat_id}/messages")
-def add_messages_to_chat(chat_id: int, request: AddMessagesRequest):
-    conn = get_conn()
-    try:
-        # Check if chat exists
-        chat_row = conn.execute(
-            "SELECT id FROM chats WHERE id = ?", [chat_id]
-        ).fetchone()
-        if not chat_row:
-            raise HTTPException(status_code=404, detail="Chat not found")
 
-        # Insert messages into chat_messages table
-        for message in request.messages:
-            conn.execute(
-                "INSERT INTO chat_messages (chat_id, role, content) VALUES (?, ?, ?)",
-                [chat_id, message["role"], message["content"]],
-            )
+@app.post("/api/chats/{chat_id}/messages")
+async def add_messages_to_chat(chat_id: int, request: AddMessagesRequest):
+    def _add() -> bool:
+        with get_conn() as conn:
+            # Check if chat exists
+            chat_row = conn.execute(
+                "SELECT id FROM chats WHERE id = ?", [chat_id]
+            ).fetchone()
+            if not chat_row:
+                return False
+
+            # Insert messages into chat_messages table
+            insert_messages(conn, chat_id, request.messages)
+            return True
+
+    if not await asyncio.to_thread(_add):
+        raise HTTPException(status_code=404, detail="Chat not found")
 
-        return {"status": "ok"}
-    finally:
-        conn.close()
+    return {"status": "ok"}
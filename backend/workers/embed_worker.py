@@ -1,4 +1,23 @@
+import hashlib
+import os
 import platform
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+import orjson
+
+try:
+    # optional: runs MiniLM as an ONNX graph under ONNX Runtime, with the fast
+    # (Rust) tokenizer, instead of sentence-transformers on PyTorch
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+    from transformers import AutoTokenizer
+except ImportError:
+    ORTModelForFeatureExtraction = None
+
+# Embeddings are contiguous float32 arrays; this one stands for "no embedding"
+EMPTY_EMBEDDING = np.empty(0, dtype=np.float32)
 
 # Check the operating system to use the appropriate embedding library.
 if platform.system() == "Darwin":
@@ -18,26 +37,169 @@ if platform.system() == "Darwin":
             
             # Forward pass to get embeddings
             outputs = model(inputs)
-            emb = outputs.text_embeds[0].tolist()
-            return emb
+            emb = outputs.text_embeds[0]
+            # unit norm, so search can rank by inner product
+            emb = emb / mx.linalg.norm(emb)
+            return np.asarray(emb.astype(mx.float32))
+
+        except Exception as e:
+            print("Embedding error:", e)
+            return EMPTY_EMBEDDING
+
+    def embed_texts(texts: List[str]):
+        """Embed a batch of texts in one padded forward pass."""
+        if not texts:
+            return []
+        try:
+            inputs = tokenizer.batch_encode_plus(
+                texts, return_tensors="mlx", padding=True, truncation=True
+            )
+            outputs = model(inputs["input_ids"], attention_mask=inputs["attention_mask"])
+            embs = outputs.text_embeds
+            embs = embs / mx.linalg.norm(embs, axis=-1, keepdims=True)
+            return np.asarray(embs.astype(mx.float32))
+
+        except Exception as e:
+            print("Embedding error:", e)
+            return [EMPTY_EMBEDDING for _ in texts]
+
+    # output size of the loaded model (sizes the HNSW index column)
+    EMBED_DIM = len(embed_text("dimension probe"))
+
+elif ORTModelForFeatureExtraction is not None:
+    MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+    # all-MiniLM-L6-v2 was trained on (and sentence-transformers truncates at) 256 tokens
+    MAX_LENGTH = 256
+    # exported once on first start, then loaded from here (backend/models, not the cwd)
+    ONNX_DIR = os.environ.get(
+        "EMBED_ONNX_DIR",
+        os.path.join(os.path.dirname(os.path.dirname(__file__)), "models", "minilm-onnx"),
+    )
+
+    def _load_onnx():
+        if os.path.isdir(ONNX_DIR):
+            return (
+                ORTModelForFeatureExtraction.from_pretrained(ONNX_DIR),
+                AutoTokenizer.from_pretrained(ONNX_DIR),
+            )
+        ort_model = ORTModelForFeatureExtraction.from_pretrained(MODEL_NAME, export=True)
+        ort_tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+        ort_model.save_pretrained(ONNX_DIR)
+        ort_tokenizer.save_pretrained(ONNX_DIR)
+        return ort_model, ort_tokenizer
+
+    model, tokenizer = _load_onnx()
+    EMBED_DIM = model.config.hidden_size
+
+    def _encode(texts: List[str]) -> np.ndarray:
+        """Mean-pooled, L2-normalized embeddings, as sentence-transformers computes them."""
+        inputs = tokenizer(
+            texts, padding=True, truncation=True, max_length=MAX_LENGTH, return_tensors="np"
+        )
+        hidden = model(**inputs).last_hidden_state
+        mask = inputs["attention_mask"][..., None].astype(np.float32)
+        embs = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        embs /= np.maximum(np.linalg.norm(embs, axis=1, keepdims=True), 1e-12)
+        return embs.astype(np.float32, copy=False)
+
+    def embed_text(text: str):
+        """Generate a normalized embedding vector for a given text."""
+        try:
+            return _encode([text])[0]
 
         except Exception as e:
             print("Embedding error:", e)
+            return EMPTY_EMBEDDING
+
+    def embed_texts(texts: List[str]):
+        """Embed a batch of texts, 32 per ONNX Runtime call."""
+        if not texts:
             return []
+        try:
+            return np.vstack([_encode(texts[i : i + 32]) for i in range(0, len(texts), 32)])
+
+        except Exception as e:
+            print("Embedding error:", e)
+            return [EMPTY_EMBEDDING for _ in texts]
 
 else:
     from sentence_transformers import SentenceTransformer
 
     MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
     model = SentenceTransformer(MODEL_NAME)
+    EMBED_DIM = model.get_sentence_embedding_dimension()
 
     def embed_text(text: str):
         """Generate a normalized embedding vector for a given text."""
         try:
             # Generate embedding and normalize.
-            emb = model.encode(text, normalize_embeddings=True)
-            return emb.tolist()
+            emb = model.encode(text, normalize_embeddings=True, convert_to_numpy=True)
+            return emb.astype(np.float32, copy=False)
+
+        except Exception as e:
+            print("Embedding error:", e)
+            return EMPTY_EMBEDDING
+
+    def embed_texts(texts: List[str]):
+        """Embed a batch of texts in one encode call."""
+        if not texts:
+            return []
+        try:
+            embs = model.encode(
+                texts, batch_size=32, normalize_embeddings=True, convert_to_numpy=True
+            )
+            return embs.astype(np.float32, copy=False)
 
         except Exception as e:
             print("Embedding error:", e)
-            return []
\ No newline at end of file
+            return [EMPTY_EMBEDDING for _ in texts]
+
+
+# Recent search-query embeddings, keyed by SHA-256 of the text
+QUERY_CACHE_SIZE = 2048
+_query_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_query_cache_lock = threading.Lock()
+
+
+def embed_query(text: str):
+    """
+    embed_text with an LRU cache for search queries, so a repeated query skips
+    the forward pass. Resumes are embedded with embed_text/embed_texts directly.
+    """
+    key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    with _query_cache_lock:
+        emb = _query_cache.get(key)
+        if emb is not None:
+            _query_cache.move_to_end(key)
+            return emb
+
+    emb = embed_text(text)
+    if emb.size:
+        with _query_cache_lock:
+            _query_cache[key] = emb
+            if len(_query_cache) > QUERY_CACHE_SIZE:
+                _query_cache.popitem(last=False)
+    return emb
+
+
+def quantize_embedding(emb):
+    """
+    Symmetric per-vector int8 quantization: returns (int8 values, scale) with
+    emb ~= q * scale. A quarter of the bytes of the float vector for search scans.
+    """
+    v = np.asarray(emb, dtype=np.float32)
+    peak = float(np.abs(v).max()) if v.size else 0.0
+    scale = peak / 127 if peak > 0 else 1.0
+    q = np.round(v / scale).astype(np.int8)
+    return q, scale
+
+
+def vector_param(vec) -> Optional[str]:
+    """
+    JSON text for binding a vector to DuckDB, CAST to DOUBLE[]/FLOAT[n] in SQL.
+    DuckDB converts list and ndarray parameters value by value, which costs tens
+    of ms per 1k-dim embedding; parsing the text takes a few ms.
+    """
+    if vec is None or len(vec) == 0:
+        return None
+    return orjson.dumps(vec, option=orjson.OPT_SERIALIZE_NUMPY).decode()
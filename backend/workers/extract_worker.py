@@ -1,12 +1,13 @@
-import json
 import logging
 import os
 import re
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
 
-import requests
+import httpx
+import orjson
 
-PARALLAX_CHAT = "http://localhost:3001/v1/chat/completions"
+# Relative to the client's base_url (PARALLAX_HOST, see server.lifespan)
+PARALLAX_CHAT = "/v1/chat/completions"
 
 
 EXTRACTION_PROMPT = """
@@ -27,24 +28,102 @@ Resume:
 """
 
 
+# Leading ```json / ``` fence or trailing ``` fence, stripped in one pass
+_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+
+
 def clean_response_content(content: str) -> str:
     """Clean and extract JSON from response content."""
-    # Remove markdown code blocks if present
-    content = re.sub(r"```json\s*", "", content)
-    content = re.sub(r"\s*```", "", content)
-    # Remove any leading/trailing whitespace
-    return content.strip()
+    # Remove markdown code blocks if present, then leading/trailing whitespace
+    return _FENCE_RE.sub("", content).strip()
+
+
+def _slice_json(s: str) -> Optional[str]:
+    """
+    Return the first balanced {...} object in s, or None.
+    Single linear scan; braces inside string literals are ignored.
+    """
+    start = s.find("{")
+    if start == -1:
+        return None
+    depth = 0
+    in_string = escape = False
+    for i in range(start, len(s)):
+        ch = s[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return s[start : i + 1]
+    return None
+
+
+def _strip_trailing_commas(s: str) -> str:
+    """Drop commas that directly precede a closing brace/bracket (outside strings)."""
+    out: List[str] = []
+    comma_at = -1  # index in out of a comma followed only by whitespace so far
+    in_string = escape = False
+    for ch in s:
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+            comma_at = -1
+        elif ch in "}]":
+            if comma_at != -1:
+                del out[comma_at]
+            comma_at = -1
+        elif ch == ",":
+            comma_at = len(out)
+        elif not ch.isspace():
+            comma_at = -1
+        out.append(ch)
+    return "".join(out)
+
+
+def salvage_json(content: str) -> Optional[Dict[str, Any]]:
+    """
+    Recover the JSON object from a reply that is not bare JSON (prose around
+    it, trailing commas). Returns None when no object can be parsed.
+    """
+    candidate = _slice_json(content)
+    if not candidate:
+        return None
+    try:
+        data = orjson.loads(_strip_trailing_commas(candidate))
+    except orjson.JSONDecodeError as e:
+        logging.warning("Could not salvage JSON from response: %s", e)
+        return None
+    return data if isinstance(data, dict) else None
 
 
-def extract_fields(resume_text: str) -> Dict[str, Any]:
+async def extract_fields_async(
+    resume_text: str, client: httpx.AsyncClient
+) -> Dict[str, Any]:
     """
-    Extract fields from resume text using Parallax API.
+    Extract fields from resume text using Parallax API, over the app's shared
+    client.
 
-    Returns normalized dictionary with the requested format.
+    Returns {"status": "ok", "data": {...fields}} or, on failure,
+    {"status": "error", "error": message, "data": {}}.
     """
     try:
         prompt = EXTRACTION_PROMPT.format(resume_text=resume_text)
-        url = PARALLAX_CHAT
 
         json_data = {
             "messages": [{"role": "user", "content": prompt}],
@@ -52,10 +131,10 @@ def extract_fields(resume_text: str) -> Dict[str, Any]:
             "chat_template_kwargs": {"enable_thinking": False},
         }
 
-        response = requests.post(url, json=json_data, timeout=30)
+        response = await client.post(PARALLAX_CHAT, json=json_data)
         response.raise_for_status()
 
-        data = response.json()
+        data = orjson.loads(response.content)
 
         # Extract content from response
         if "choices" not in data or not data["choices"]:
@@ -80,57 +159,31 @@ def extract_fields(resume_text: str) -> Dict[str, Any]:
         cleaned_content = clean_response_content(content)
 
         try:
-            extracted_data = json.loads(cleaned_content)
-        except json.JSONDecodeError as e:
-            logging.error("JSON decode error: %s", str(e))
-            return {
-                "status": "error",
-                "error": "Failed to parse JSON response",
-                "Full Name": "",
-                "Email": "",
-                "Phone": "",
-                "Skills": [],
-                "Total Experience": "",
-                "Education Summary": "",
-                "Professional Summary": "",
-                "raw_text": resume_text,
-            }
-
-        # Normalize the data to the requested format
-        normalized = {
-            "Full Name": extracted_data.get(
-                "Full Name", extracted_data.get("full_name", "")
-            ),
-            "Email": extracted_data.get("Email", extracted_data.get("email", "")),
-            "Phone": extracted_data.get("Phone", extracted_data.get("phone", "")),
-            "Skills": extracted_data.get("Skills", extracted_data.get("skills", [])),
-            "Total Experience": extracted_data.get(
-                "Total Experience", extracted_data.get("total_experience", "")
-            ),
-            "Education Summary": extracted_data.get(
-                "Education Summary", extracted_data.get("education_summary", "")
-            ),
-            "Professional Summary": extracted_data.get(
-                "Professional Summary", extracted_data.get("professional_summary", "")
-            ),
-            "raw_text": resume_text,
-        }
-
-        return {"status": "ok", "data": normalized}
-
-    except requests.exceptions.RequestException as e:
+            extracted_data = orjson.loads(cleaned_content)
+        except orjson.JSONDecodeError as e:
+            # the model sometimes wraps the object in prose or leaves trailing commas
+            extracted_data = salvage_json(cleaned_content)
+            if extracted_data is None:
+                logging.error("JSON decode error: %s", str(e))
+                return {
+                    "status": "error",
+                    "error": "Failed to parse JSON response",
+                    "data": {},
+                }
+
+        # Key variants are mapped onto the canonical fields by the caller
+        # (server.canonicalize), in the same pass that flattens Skills.
+        if not isinstance(extracted_data, dict):
+            raise ValueError("Extracted JSON is not an object")
+
+        return {"status": "ok", "data": extracted_data}
+
+    except httpx.HTTPError as e:
         logging.error("Request error: %s", str(e))
         return {
             "status": "error",
             "error": f"API request failed: {str(e)}",
-            "Full Name": "",
-            "Email": "",
-            "Phone": "",
-            "Skills": [],
-            "Total Experience": "",
-            "Education Summary": "",
-            "Professional Summary": "",
-            "raw_text": "",
+            "data": {},
         }
 
     except Exception as e:
@@ -138,12 +191,5 @@ def extract_fields(resume_text: str) -> Dict[str, Any]:
         return {
             "status": "error",
             "error": f"Unexpected error: {str(e)}",
-            "Full Name": "",
-            "Email": "",
-            "Phone": "",
-            "Skills": [],
-            "Total Experience": "",
-            "Education Summary": "",
-            "Professional Summary": "",
-            "raw_text": "",
+            "data": {},
         }
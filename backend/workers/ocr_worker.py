@@ -1,28 +1,95 @@
 import os
+from typing import Optional
 
+import pypdfium2 as pdfium
+import torch
 from doctr.io import DocumentFile
 from doctr.models import ocr_predictor
 
-model = ocr_predictor(pretrained=True)
+# Run the detection/recognition CNNs on the GPU when there is one
+DEV = (
+    "mps"
+    if torch.backends.mps.is_available()
+    else "cuda"
+    if torch.cuda.is_available()
+    else "cpu"
+)
+
+# Intra-op threads per OCR pool process; the pool itself provides the parallelism
+TORCH_THREADS = 2
+
+# PDFs whose text layer has at least this many non-whitespace chars skip OCR
+MIN_TEXT_LAYER_CHARS = 200
+
+# Loaded on first use (or by init_worker in OCR pool processes), so processes
+# that only import this module don't pay for the model.
+model = None
+
+
+def _get_model():
+    global model
+    if model is None:
+        model = ocr_predictor(pretrained=True).to(DEV)
+    return model
+
+
+def init_worker():
+    """ProcessPoolExecutor initializer: load the model once per worker process."""
+    # without this every worker starts one torch thread per core
+    torch.set_num_threads(TORCH_THREADS)
+    _get_model()
+
+
+def _try_fast_text(file_path: str) -> Optional[str]:
+    """
+    Return the PDF's embedded text layer (Word/LaTeX exports have one), or None
+    for scanned PDFs. pypdfium2 is what doctr itself uses to open PDFs.
+    """
+    try:
+        pdf = pdfium.PdfDocument(file_path)
+    except Exception:
+        return None
+    try:
+        pages = []
+        for i in range(len(pdf)):
+            page = pdf[i]
+            textpage = page.get_textpage()
+            pages.append(textpage.get_text_range())
+            textpage.close()
+            page.close()
+    except Exception:
+        return None  # malformed page: leave the file to doctr
+    finally:
+        pdf.close()
+
+    text = "\n".join(pages).replace("\r\n", "\n")
+    if len("".join(text.split())) < MIN_TEXT_LAYER_CHARS:
+        return None
+    return text
 
 
 def extract_text(file_path: str) -> str:
+    is_pdf = file_path.lower().endswith(".pdf")
+    if is_pdf:
+        text = _try_fast_text(file_path)
+        if text:
+            return text
+
     # Load document (PDF or image)
     doc = (
         DocumentFile.from_pdf(file_path)
-        if file_path.lower().endswith(".pdf")
+        if is_pdf
         else DocumentFile.from_images(file_path)
     )
 
-    # Analyze document
-    result = model(doc)
+    # Analyze document (doctr batches the pages internally)
+    with torch.inference_mode():
+        result = _get_model()(doc)
 
     # Extract text
-    text_lines = []
-    for page in result.pages:
-        for block in page.blocks:
-            for line in block.lines:
-                line_text = " ".join([word.value for word in line.words])
-                text_lines.append(line_text)
-
-    return "\n".join(text_lines)
\ No newline at end of file
+    return "\n".join(
+        " ".join(word.value for word in line.words)
+        for page in result.pages
+        for block in page.blocks
+        for line in block.lines
+    )
@@ -1,23 +1,34 @@
 import logging
-import os
-import json
+import math
 
-import duckdb
-import requests
+import numpy as np
 
-from .embed_worker import embed_text
+from .embed_worker import embed_query, quantize_embedding, vector_param
 
+TOP_K = 3
+# int8 shortlist size re-ranked with the FP32 embeddings (at least top_k)
+RERANK_K = 10
+# Hybrid search: BM25 hits re-ranked by vector, and the blend weights
+BM25_CANDIDATES = 200
+BM25_WEIGHT = 0.4
+VECTOR_WEIGHT = 0.6
 
-def search_candidates(query: str):
-    # 1. Local MLX embedding
-    q_embed = embed_text(query)
+COLUMN_NAMES = [
+    "id",
+    "name",
+    "email",
+    "phone",
+    "experience_years",
+    "skills",
+    "education_summary",
+    "professional_summary",
+]
 
-    if not q_embed:
-        return []
-
-    # 2. DuckDB vector similarity search
-    conn = duckdb.connect("db/candidates.duckdb", read_only=True)
 
+def _with_display_columns(conn, hits):
+    """[(id, distance), ...] -> display rows + distance, in the same order."""
+    if not hits:
+        return []
     rows = conn.execute(
         """
         SELECT
@@ -28,47 +39,165 @@ def search_candidates(query: str):
             experience_years,
             skills,
             education_summary,
-            professional_summary,
-            embedding <-> ? AS distance
+            professional_summary
         FROM candidates
-        WHERE embedding IS NOT NULL
+        WHERE id IN (SELECT unnest(?))
+    """,
+        [[cid for cid, _ in hits]],
+    ).fetchall()
+    by_id = {row[0]: row for row in rows}
+    return [by_id[cid] + (distance,) for cid, distance in hits if cid in by_id]
+
+
+def _hybrid_search(conn, query: str, q_embed, top_k: int):
+    """
+    Keyword candidates from the fts BM25 index, re-ranked by a blend of
+    normalized BM25 and vector closeness. Only BM25_CANDIDATES rows ever get a
+    vector comparison.
+    """
+    hits = conn.execute(
+        f"""
+        SELECT b.id, b.score, list_dot_product(e.embedding, CAST(? AS DOUBLE[]))
+        FROM (
+            SELECT id, score
+            FROM (
+                SELECT id, fts_main_candidates.match_bm25(id, ?) AS score
+                FROM candidates
+            )
+            WHERE score IS NOT NULL
+            ORDER BY score DESC
+            LIMIT {BM25_CANDIDATES}
+        ) b
+        JOIN candidate_embeddings e ON e.candidate_id = b.id
+        WHERE len(e.embedding) = ?
+    """,
+        [vector_param(q_embed), query, len(q_embed)],
+    ).fetchall()
+    if not hits:
+        return []
+
+    top_bm25 = max(score for _, score, _ in hits) or 1.0
+    ranked = []
+    for cid, score, similarity in hits:
+        distance = math.sqrt(max(0.0, 2.0 - 2.0 * similarity))
+        blended = BM25_WEIGHT * score / top_bm25 + VECTOR_WEIGHT * (1.0 - distance)
+        ranked.append((blended, cid, distance))
+    ranked.sort(reverse=True)
+    return _with_display_columns(
+        conn, [(cid, distance) for _, cid, distance in ranked[:top_k]]
+    )
+
+
+def _ann_search(conn, q_embed, dim: int, top_k: int):
+    """
+    HNSW index lookup on embedding_vec (vss, inner-product metric). Vectors are
+    unit norm, so distance = sqrt(2 - 2 * similarity) as in the brute-force path.
+    """
+    hits = conn.execute(
+        f"""
+        SELECT candidate_id, array_negative_inner_product(embedding_vec, CAST($1 AS FLOAT[{dim}]))
+        FROM candidate_embeddings
+        ORDER BY array_negative_inner_product(embedding_vec, CAST($1 AS FLOAT[{dim}]))
+        LIMIT {top_k}
+    """,
+        [vector_param(q_embed)],
+    ).fetchall()
+    # rows without an embedding of this dim score NULL
+    hits = [
+        (cid, math.sqrt(max(0.0, 2.0 + 2.0 * neg_ip)))
+        for cid, neg_ip in hits
+        if neg_ip is not None
+    ]
+    return _with_display_columns(conn, hits)
+
+
+def _brute_force_search(conn, q_embed, top_k: int):
+    """Score every int8 embedding with one NumPy matmul, then re-rank in FP32 (no vss available)."""
+    # Load the int8 embeddings as one (N, D) matrix (from the narrow
+    # candidate_embeddings table) and score them in a single BLAS call. Embeddings are normalized, so ranking by dot product
+    # matches ranking by L2 distance, and for unit vectors
+    # distance = sqrt(2 - 2 * similarity).
+    q_quant, q_scale = quantize_embedding(q_embed)
+    data = conn.execute(
+        """
+        SELECT candidate_id, embedding_q, embedding_scale
+        FROM candidate_embeddings
+        WHERE embedding_q IS NOT NULL AND len(embedding_q) = ?
+    """,
+        [len(q_quant)],
+    ).fetchnumpy()
+
+    ids = data["candidate_id"]
+    if len(ids) == 0:
+        return []
+
+    # int8 values are exact in float32, which keeps the matmul on SGEMM
+    matrix = np.vstack(data["embedding_q"]).astype(np.float32)
+    scales = np.asarray(data["embedding_scale"], dtype=np.float32)
+    scores = (matrix @ q_quant.astype(np.float32)) * scales * q_scale
+
+    # int8 scores pick a shortlist; the FP32 embeddings re-rank it exactly
+    k = min(max(RERANK_K, top_k), len(scores))
+    shortlist = [int(i) for i in ids[np.argpartition(scores, -k)[-k:]]]
+
+    return conn.execute(
+        f"""
+        SELECT
+            c.id,
+            c.name,
+            c.email,
+            c.phone,
+            c.experience_years,
+            c.skills,
+            c.education_summary,
+            c.professional_summary,
+            sqrt(greatest(0, 2 - 2 * list_dot_product(e.embedding, CAST(? AS DOUBLE[])))) AS distance
+        FROM candidate_embeddings e
+        JOIN candidates c ON c.id = e.candidate_id
+        WHERE e.candidate_id IN (SELECT unnest(?))
         ORDER BY distance ASC
-        LIMIT 3
+        LIMIT {top_k}
     """,
-        [q_embed],
+        [vector_param(q_embed), shortlist],
     ).fetchall()
 
-    conn.close()
+
+def search_candidates(
+    conn, query: str, ann_dim=None, top_k: int = TOP_K, hybrid: bool = False
+):
+    # 1. Local MLX embedding (cached for repeated queries)
+    q_embed = embed_query(query)
+
+    if q_embed.size == 0:
+        return []
+
+    # 2. Keyword hits first when the fts index is available (conn is a cursor
+    # borrowed from the server pool)
+    rows = _hybrid_search(conn, query, q_embed, top_k) if hybrid else []
+
+    # 3. DuckDB vector similarity search fills the remaining slots (or all of
+    # them). ann_dim is set when the HNSW index is available.
+    if len(rows) < top_k:
+        if ann_dim and len(q_embed) == ann_dim:
+            vector_rows = _ann_search(conn, q_embed, ann_dim, top_k)
+        else:
+            vector_rows = _brute_force_search(conn, q_embed, top_k)
+        seen = {row[0] for row in rows}
+        rows += [row for row in vector_rows if row[0] not in seen][: top_k - len(rows)]
 
     if not rows:
         return []
 
     logging.info("Candidates Result 🙍 -> %s", rows)
 
-    # 3. Format results into a list of dictionaries
+    # 4. Format results into a list of dictionaries, best match first
     results = []
-    column_names = [
-        "id",
-        "name",
-        "email",
-        "phone",
-        "experience_years",
-        "skills",
-        "education_summary",
-        "professional_summary",
-        "distance",
-    ]
     for row in rows:
-        candidate = dict(zip(column_names, row))
-        # Parse skills from JSON string to list
-        try:
-            if candidate["skills"]:
-                candidate["skills"] = json.loads(candidate["skills"])
-            else:
-                candidate["skills"] = []
-        except (json.JSONDecodeError, TypeError):
-            # If skills is not valid JSON or not a string, default to empty list
-            candidate["skills"] = []
+        candidate = dict(zip(COLUMN_NAMES + ["distance"], row))
+        if candidate["distance"] is None:
+            continue  # no embedding of this dim
+        # skills is a native VARCHAR[] column, already a list (or NULL)
+        candidate["skills"] = candidate["skills"] or []
         results.append(candidate)
 
     return results